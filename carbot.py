@@ -1,12 +1,23 @@
-import os
-import requests
+import asyncio
+import functools
+import httpx
+import numpy as np
 import random
 import logging
-import json
-from dotenv import load_dotenv
+import orjson
+import hashlib
+import string
+import time
+from collections import OrderedDict
+import redis.asyncio as redis
+from config import settings
 from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram.ext import AIORateLimiter, Application, CommandHandler, ContextTypes
+import openai
 from openai import AsyncOpenAI
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Literal, Optional
 
 # Set up logging with a stream handler
 logger = logging.getLogger('carbot')
@@ -15,38 +26,220 @@ handler = logging.StreamHandler()
 handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
 logger.addHandler(handler)
 
-# Load environment variables
-load_dotenv()
+# Load configuration (reads .env once and validates required keys)
+TOKEN = settings().token
+AUTO_DEV_API_KEY = settings().auto_dev_api_key
+OPENAI_API_KEY = settings().openai_api_key
+REDIS_URL = settings().redis_url
+WEBHOOK_URL = settings().webhook_url
+WEBHOOK_SECRET = settings().webhook_secret
+PORT = settings().port
 
-# Get environment variables
-# TOKEN = os.getenv('TEST_TELEGRAM_BOT_TOKEN') # used to test 
-TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-AUTO_DEV_API_KEY = os.getenv('AUTO_DEV_API_KEY')
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Telegram file_ids for the fallback photos. Seeded from the environment when
+# available, otherwise captured from the first upload and reused afterwards.
+photo_file_ids = {
+    './betless.jpeg': settings().betless_file_id,
+}
 
-# Initialize OpenAI client
-aclient = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# Initialize OpenAI client with a tuned HTTP/2 connection pool shared by all handlers
+aclient = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+        timeout=httpx.Timeout(8.0, connect=3.0)
+    )
+)
+# Same connection pool without SDK retries, for calls wrapped in openai_retry
+_parse_client = aclient.with_options(max_retries=0)
 
-# Validate environment variables
-if not TOKEN or not AUTO_DEV_API_KEY:
-    logger.error("Missing required environment variables. Please check your .env file.")
-    raise ValueError("Missing required environment variables. Please check your .env file.")
+# Retry transient failures twice with short jittered backoff. Each retried call
+# also has a hard total budget, so the worst case for one /car request
+# (embedding 1.5s + OpenAI 12s + Auto.dev 8s) stays inside Telegram's 30s
+# handler window. Errors are re-raised after the last try.
+OPENAI_BUDGET = 12.0
+AUTODEV_BUDGET = 8.0
 
-if not OPENAI_API_KEY:
-    logger.error("Missing OpenAI API key in .env file")
-    raise ValueError("Missing OpenAI API key in .env file")
+def is_transient_http_error(e: BaseException) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text('Welcome! Use /car [amount] to find a car around that price.')
+def is_transient_openai_error(e: BaseException) -> bool:
+    # Mirrors the SDK's own retry policy: timeouts, connection errors, 408/409/429 and 5xx
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code in (408, 409, 429) or e.status_code >= 500
+    return isinstance(e, (openai.APITimeoutError, openai.APIConnectionError))
 
-async def parse_car_query(query: str) -> dict[str, any]:
-    """Convert natural language query to Auto.dev API parameters"""
-    try:
-        logger.info(f"Sending query to OpenAI: {query}")
-        response = await aclient.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": """Convert natural language car search queries into Auto.dev API parameters.
+def with_budget(seconds: float):
+    """Cap the total wall time of a coroutine function, retries included"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await asyncio.wait_for(func(*args, **kwargs), seconds)
+        return wrapper
+    return decorator
+
+autodev_retry = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=0.1, max=1.0),
+    retry=retry_if_exception(is_transient_http_error),
+    reraise=True
+)
+openai_retry = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=0.1, max=1.0),
+    retry=retry_if_exception(is_transient_openai_error),
+    reraise=True
+)
+
+# Shared async HTTP client for Auto.dev so requests don't block the event loop.
+# Keep-alive connections are pooled so repeat calls skip the TCP/TLS handshake.
+client = httpx.AsyncClient(
+    timeout=httpx.Timeout(4.0, connect=2.0),
+    limits=httpx.Limits(
+        max_connections=32,
+        max_keepalive_connections=32,
+        keepalive_expiry=60.0
+    )
+)
+
+# Optional Redis cache for Auto.dev responses (disabled when REDIS_URL is unset).
+# Short socket timeouts keep an unreachable Redis from stalling /car replies.
+redis_client = redis.from_url(
+    REDIS_URL,
+    socket_timeout=0.5,
+    socket_connect_timeout=0.5
+) if REDIS_URL else None
+
+# Strong references to fire-and-forget tasks so they aren't garbage collected
+background_tasks: set[asyncio.Task] = set()
+
+# Cache TTL for Auto.dev responses, in seconds
+AUTODEV_CACHE_TTL = 60
+
+# Auto.dev page size and the listing fields the bot actually uses
+AUTODEV_PAGE_LIMIT = 20
+LISTING_FIELDS = ("year", "make", "model", "price", "primaryPhotoUrl")
+AUTODEV_URL = "https://auto.dev/api/listings"
+_BASE_PARAMS = {
+    "apikey": AUTO_DEV_API_KEY,
+    "page": 1,
+    "limit": AUTODEV_PAGE_LIMIT,
+    "exclude_no_price": "true"
+}
+
+# Warm pool of listings per coarse price bucket, refreshed in the background.
+# Plain /car <amount> requests within BUCKET_TOLERANCE of a bucket are served
+# from the bucket's listings that fall inside the request's own price window.
+# Buckets that haven't refreshed within BUCKET_MAX_AGE are ignored.
+PRICE_BUCKETS = (5000, 10000, 15000, 20000, 25000, 30000, 40000, 50000, 75000, 100000, 150000, 250000, 500000, 1000000)
+BUCKET_TOLERANCE = 0.1
+BUCKET_REFRESH_INTERVAL = 300
+BUCKET_MAX_AGE = 2 * BUCKET_REFRESH_INTERVAL
+BUCKET_CACHE: dict[int, tuple[float, list]] = {}
+
+# Semantic cache for parse_car_query: equivalent queries ("red bmw", "a red BMW")
+# reuse earlier results when their embeddings are close enough. Entries are
+# namespaced by the parsing model so a model change never serves stale output.
+PARSE_MODEL = "gpt-4o-mini"
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+EMBEDDING_TIMEOUT = 1.5
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_TTL = 3600
+SEMANTIC_CACHE_MAX_ENTRIES = 1024
+
+class SemanticCache:
+    """Fixed-size ring buffer of unit-length query embeddings and their params"""
+
+    def __init__(self, size: int, dimensions: int):
+        self.vectors = np.zeros((size, dimensions), dtype=np.float32)
+        self.expires = np.zeros(size, dtype=np.float64)
+        self.params: list[dict | None] = [None] * size
+        self.next_slot = 0
+
+    def lookup(self, query_vector: np.ndarray) -> dict | None:
+        """Return params for the closest unexpired entry above the threshold"""
+        # Rows are unit length, so the dot product is the cosine similarity
+        scores = self.vectors @ query_vector
+        scores[self.expires <= time.monotonic()] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] >= SEMANTIC_CACHE_THRESHOLD:
+            logger.debug("Semantic cache hit (similarity %.3f)", scores[best])
+            return dict(self.params[best])
+        return None
+
+    def store(self, query_vector: np.ndarray, params: dict) -> None:
+        slot = self.next_slot
+        self.vectors[slot] = query_vector
+        self.expires[slot] = time.monotonic() + SEMANTIC_CACHE_TTL
+        self.params[slot] = dict(params)
+        self.next_slot = (slot + 1) % len(self.params)
+
+semantic_caches: dict[str, SemanticCache] = {}
+
+# Exact-match LRU cache for parse_car_query, keyed on the normalized query.
+QUERY_CACHE_MAX_ENTRIES = 1024
+query_cache: OrderedDict[str, dict] = OrderedDict()
+
+# Closed vocabularies for the rule-based fast path in parse_car_query. Queries
+# made up entirely of these words are resolved locally without OpenAI.
+COLORS = frozenset({"black", "silver", "white", "gray", "red", "green", "yellow", "blue", "brown", "orange", "purple", "gold"})
+BODIES = frozenset({"convertible", "coupe", "minivan", "crossover", "sedan", "suv", "truck", "wagon"})
+CONDITIONS = frozenset({"new", "used"})
+TRANSMISSIONS = frozenset({"automatic", "manual"})
+DRIVELINES = {"rwd": "RWD", "fwd": "FWD", "4x4": "4X4", "awd": "AWD"}
+MAKES = {
+    "acura": "Acura",
+    "audi": "Audi",
+    "bmw": "BMW",
+    "buick": "Buick",
+    "cadillac": "Cadillac",
+    "chevrolet": "Chevrolet",
+    "chevy": "Chevrolet",
+    "chrysler": "Chrysler",
+    "dodge": "Dodge",
+    "ferrari": "Ferrari",
+    "fiat": "Fiat",
+    "ford": "Ford",
+    "genesis": "Genesis",
+    "gmc": "GMC",
+    "honda": "Honda",
+    "hyundai": "Hyundai",
+    "infiniti": "Infiniti",
+    "jaguar": "Jaguar",
+    "jeep": "Jeep",
+    "kia": "Kia",
+    "lamborghini": "Lamborghini",
+    "lexus": "Lexus",
+    "lincoln": "Lincoln",
+    "maserati": "Maserati",
+    "mazda": "Mazda",
+    "mclaren": "McLaren",
+    "mercedes": "Mercedes-Benz",
+    "mercedesbenz": "Mercedes-Benz",
+    "mini": "MINI",
+    "mitsubishi": "Mitsubishi",
+    "nissan": "Nissan",
+    "porsche": "Porsche",
+    "ram": "Ram",
+    "subaru": "Subaru",
+    "tesla": "Tesla",
+    "toyota": "Toyota",
+    "volkswagen": "Volkswagen",
+    "vw": "Volkswagen",
+    "volvo": "Volvo",
+}
+FILLER_WORDS = frozenset({"a", "an", "the"})
+
+# Strips punctuation in one pass when normalizing queries
+_PUNCT_TR = str.maketrans("", "", string.punctuation)
+
+# Static prompt and schema for parse_car_query, built once at import time.
+# The system message must stay byte-identical across calls so OpenAI's
+# prompt caching can reuse the prefix.
+_SYSTEM_MSG = {"role": "system", "content": """Convert natural language car search queries into Auto.dev API parameters.
 
 Important formatting rules:
 1. Car makes must use proper capitalization (e.g., "BMW", "Mercedes-Benz", "Audi", "Toyota", "Hyundai", "Porsche"). Only capitalize the first letter of each word unless the make is an abbreviation like "BMW" or "MDX". Do not capitalize the full word for other makes.  
@@ -61,137 +254,342 @@ Examples:
 - "red bmw" → {"make": "BMW", "exterior_color[]": "red"}
 - "used toyota suv" → {"make": "Toyota", "body_style[]": "suv", "condition[]": "used"}
 - "manual mercedes" → {"make": "Mercedes-Benz", "transmission[]": "manual"}
-- "porsche" → {"make": "Porsche"}"""},
-                {"role": "user", "content": f"Convert this car search query to parameters: {query}"}
-            ],
-            temperature=0.1,
-            max_tokens=250,
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "car_search_params",
-                    "strict": True,
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "make": {"type": ["string", "null"]},
-                            "model": {"type": ["string", "null"]},
-                            "exterior_color[]": {"type": ["string", "null"], "enum": ["black", "silver", "white", "gray", "red", "green", "yellow", "blue", "brown", "orange", "purple", "gold", None]},
-                            "body_style[]": {"type": ["string", "null"], "enum": ["convertible", "coupe", "minivan", "crossover", "sedan", "suv", "truck", "wagon", None]},
-                            "category": {"type": ["string", "null"], "enum": ["american", "classic", "commuter", "electric", "family", "fuel_efficient", "hybrid", "muscle", "sport", "supercar", None]},
-                            "condition[]": {"type": ["string", "null"], "enum": ["new", "used", "certified pre-owned", None]},
-                            "features[]": {"type": ["string", "null"], "enum": ["backup_camera", "bluetooth", "heated_seats", "leather", "navigation", "sunroof", None]},
-                            "transmission[]": {"type": ["string", "null"], "enum": ["automatic", "manual", None]},
-                            "driveline[]": {"type": ["string", "null"], "enum": ["RWD", "FWD", "4X4", "AWD", None]},
-                            "sort_filter": {"type": ["string", "null"], "enum": ["price:asc", "price:desc", "year:desc", "mileage:asc", None]}
-                        },
-                        "required": [
-                            "make", "model", "exterior_color[]", "body_style[]", "category", 
-                            "condition[]", "features[]", "transmission[]", 
-                            "driveline[]", "sort_filter"
-                        ],
-                        "additionalProperties": False
-                    }
-                }
-            }
+- "porsche" → {"make": "Porsche"}"""}
+
+class CarParams(BaseModel):
+    """Structured output schema for parse_car_query"""
+    model_config = ConfigDict(populate_by_name=True)
+
+    make: Optional[str] = None
+    model: Optional[str] = None
+    exterior_color: Optional[Literal["black", "silver", "white", "gray", "red", "green", "yellow", "blue", "brown", "orange", "purple", "gold"]] = Field(None, alias="exterior_color[]")
+    body_style: Optional[Literal["convertible", "coupe", "minivan", "crossover", "sedan", "suv", "truck", "wagon"]] = Field(None, alias="body_style[]")
+    category: Optional[Literal["american", "classic", "commuter", "electric", "family", "fuel_efficient", "hybrid", "muscle", "sport", "supercar"]] = None
+    condition: Optional[Literal["new", "used", "certified pre-owned"]] = Field(None, alias="condition[]")
+    features: Optional[Literal["backup_camera", "bluetooth", "heated_seats", "leather", "navigation", "sunroof"]] = Field(None, alias="features[]")
+    transmission: Optional[Literal["automatic", "manual"]] = Field(None, alias="transmission[]")
+    driveline: Optional[Literal["RWD", "FWD", "4X4", "AWD"]] = Field(None, alias="driveline[]")
+    sort_filter: Optional[Literal["price:asc", "price:desc", "year:desc", "mileage:asc"]] = None
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.message.reply_text('Welcome! Use /car [amount] to find a car around that price.')
+
+async def embed_query(query: str) -> np.ndarray | None:
+    """Return the unit-length embedding for a query, or None if unavailable"""
+    try:
+        response = await asyncio.wait_for(
+            aclient.embeddings.create(model=EMBEDDING_MODEL, input=query, dimensions=EMBEDDING_DIMENSIONS),
+            EMBEDDING_TIMEOUT
         )
+    except Exception as e:
+        logger.warning(f"Embedding failed, skipping semantic cache: {e!r}")
+        return None
 
-        # Log complete response object for debugging
-        logger.info(f"Complete OpenAI Response: {response}")
-        
-        # Get the response content
-        raw_response = response.choices[0].message.content
-        logger.info(f"Raw AI Response: {raw_response}")
-        
-        if not raw_response or raw_response.isspace():
-            logger.error("OpenAI returned empty or whitespace response")
-            return {}
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
 
-        try:
-            # Parse the response into a Python dict using json.loads instead of eval
-            params = json.loads(raw_response)
-            logger.info(f"Parsed parameters: {params}")
-            
-            # Filter out null values
-            filtered_params = {k: v for k, v in params.items() if v is not None}
-            logger.info(f"Filtered parameters being returned: {filtered_params}")
-            return filtered_params
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse AI response: {raw_response}")
-            logger.error(f"JSON decode error: {e}")
+def semantic_cache_for_model() -> SemanticCache:
+    cache = semantic_caches.get(PARSE_MODEL)
+    if cache is None:
+        cache = semantic_caches[PARSE_MODEL] = SemanticCache(SEMANTIC_CACHE_MAX_ENTRIES, EMBEDDING_DIMENSIONS)
+    return cache
+
+def query_cache_store(key: str, params: dict) -> None:
+    query_cache[key] = dict(params)
+    query_cache.move_to_end(key)
+    if len(query_cache) > QUERY_CACHE_MAX_ENTRIES:
+        query_cache.popitem(last=False)
+
+def normalize_query(query: str) -> str:
+    """Lower-case a query, strip punctuation and collapse whitespace"""
+    return " ".join(query.lower().translate(_PUNCT_TR).split())
+
+def match_simple_query(query: str) -> dict | None:
+    """Resolve queries made only of known makes, colors and options, else None"""
+    params = {}
+    for token in query.split():
+        if token in FILLER_WORDS:
+            continue
+        if token in MAKES:
+            key, value = "make", MAKES[token]
+        elif token in COLORS:
+            key, value = "exterior_color[]", token
+        elif token in BODIES:
+            key, value = "body_style[]", token
+        elif token in CONDITIONS:
+            key, value = "condition[]", token
+        elif token in TRANSMISSIONS:
+            key, value = "transmission[]", token
+        elif token in DRIVELINES:
+            key, value = "driveline[]", DRIVELINES[token]
+        else:
+            return None
+        # Conflicting values (e.g. "red blue") need the model to decide
+        if params.get(key, value) != value:
+            return None
+        params[key] = value
+    return params or None
+
+@with_budget(OPENAI_BUDGET)
+@openai_retry
+async def complete_car_query(query: str):
+    """Ask OpenAI to parse a query into CarParams"""
+    # openai_retry replaces the SDK's retries here so the two don't multiply
+    return await _parse_client.beta.chat.completions.parse(
+        model=PARSE_MODEL,
+        messages=[
+            _SYSTEM_MSG,
+            {"role": "user", "content": f"Convert this car search query to parameters: {query}"}
+        ],
+        temperature=0.1,
+        max_tokens=250,
+        response_format=CarParams
+    )
+
+async def parse_car_query(query: str) -> dict[str, any]:
+    """Convert natural language query to Auto.dev API parameters"""
+    cache_key = normalize_query(query)
+    if cache_key in query_cache:
+        query_cache.move_to_end(cache_key)
+        return dict(query_cache[cache_key])
+
+    params = match_simple_query(cache_key)
+    if params is not None:
+        logger.debug("Resolved query locally: %s", params)
+        query_cache_store(cache_key, params)
+        return params
+
+    # Start the completion alongside the embedding so a semantic miss doesn't
+    # pay for both round trips back to back; a hit cancels the completion.
+    # Semantic hits are not copied into query_cache so they keep their TTL.
+    logger.debug("Sending query to OpenAI: %s", query)
+    completion_task = asyncio.create_task(complete_car_query(query))
+    embedding = await embed_query(query)
+    if embedding is not None:
+        cached = semantic_cache_for_model().lookup(embedding)
+        if cached is not None:
+            completion_task.cancel()
+            return cached
+
+    try:
+        response = await completion_task
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("OpenAI response id=%s tokens=%s", response.id, response.usage.total_tokens)
+
+        parsed = response.choices[0].message.parsed
+        if parsed is None:
+            logger.error("OpenAI returned no parsed parameters")
             return {}
 
+        params = parsed.model_dump(by_alias=True, exclude_none=True)
+        logger.debug("Parsed parameters: %s", params)
+        if embedding is not None:
+            semantic_cache_for_model().store(embedding, params)
+        query_cache_store(cache_key, params)
+        return params
+
     except Exception as e:
         logger.error(f"Error in OpenAI call: {str(e)}")
         return {}
 
-async def get_autodev_car(update: Update, target_price: int, search_query: str = None) -> None:
-    url = "https://auto.dev/api/listings"
-    params = {
-        "apikey": AUTO_DEV_API_KEY,
-        "price_min": max(0, target_price * 0.9),
-        "price_max": target_price * 1.10,
-        "page": 1,
-        "exclude_no_price": "true"
+async def get_cached_listings(key: str) -> dict | None:
+    """Return a cached Auto.dev response for the given key, if any"""
+    if redis_client is None:
+        return None
+    try:
+        cached = await redis_client.get(key)
+    except redis.RedisError as e:
+        logger.warning(f"Redis GET failed: {e}")
+        return None
+    if cached is None:
+        return None
+    logger.debug("Cache hit for %s", key)
+    return orjson.loads(cached)
+
+async def set_cached_listings(key: str, raw: bytes) -> None:
+    """Store a serialized Auto.dev response under the given key"""
+    if redis_client is None:
+        return
+    try:
+        await redis_client.set(key, raw, ex=AUTODEV_CACHE_TTL)
+    except redis.RedisError as e:
+        logger.warning(f"Redis SET failed: {e}")
+
+async def reply_local_photo(update: Update, path: str) -> None:
+    """Reply with a bundled photo, uploading it only the first time"""
+    file_id = photo_file_ids.get(path)
+    if file_id:
+        await update.message.reply_photo(photo=file_id)
+        return
+
+    with open(path, 'rb') as photo:
+        message = await update.message.reply_photo(photo=photo)
+    photo_file_ids[path] = message.photo[-1].file_id
+    logger.info(f"Cached Telegram file_id for {path}")
+
+def listing_params(target_price: int) -> dict:
+    """Build the base Auto.dev query for listings within 10% of a price"""
+    # Integer math keeps float noise out of the request and the cache key
+    return {
+        **_BASE_PARAMS,
+        "price_min": max(0, target_price * 9 // 10),
+        "price_max": target_price * 11 // 10
     }
 
+def describe_http_error(e: httpx.HTTPError) -> str:
+    """Summarize an httpx error without the apikey query parameter"""
+    try:
+        url = e.request.url.copy_remove_param("apikey")
+    except RuntimeError:
+        # No request attached to the error
+        return type(e).__name__
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"HTTP {e.response.status_code} for {url}"
+    return f"{type(e).__name__} for {url}"
+
+@with_budget(AUTODEV_BUDGET)
+@autodev_retry
+async def fetch_listings(params: dict) -> list[dict]:
+    """Fetch one page of Auto.dev listings, trimmed to LISTING_FIELDS"""
+    response = await client.get(AUTODEV_URL, params=params)
+
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        logger.warning(f"Auto.dev error: {describe_http_error(e)}")
+        logger.debug("Response content: %s", response.text)
+        raise
+
+    # Keep only the fields we read so the cache and heap hold small records
+    return [
+        {field: record[field] for field in LISTING_FIELDS if field in record}
+        for record in orjson.loads(response.content).get('records', [])
+    ]
+
+def nearest_bucket(target_price: int) -> int | None:
+    """Return the price bucket close enough to serve target_price, if any"""
+    bucket = min(PRICE_BUCKETS, key=lambda b: abs(b - target_price))
+    if abs(bucket - target_price) <= bucket * BUCKET_TOLERANCE:
+        return bucket
+    return None
+
+def listing_price(record: dict) -> int | None:
+    """Return a listing's price as an int from a number or a "$25,995"-style string"""
+    price = record.get('price')
+    if isinstance(price, (int, float)):
+        return int(price)
+    if isinstance(price, str):
+        digits = "".join(ch for ch in price.split('.')[0] if ch.isdigit())
+        return int(digits) if digits else None
+    return None
+
+def bucket_records(target_price: int) -> list | None:
+    """Return fresh bucket listings inside target_price's own window, if any"""
+    bucket = nearest_bucket(target_price)
+    if bucket is None or bucket not in BUCKET_CACHE:
+        return None
+
+    fetched_at, records = BUCKET_CACHE[bucket]
+    if time.monotonic() - fetched_at > BUCKET_MAX_AGE:
+        return None
+
+    window = listing_params(target_price)
+    matching = [
+        record for record in records
+        if (price := listing_price(record)) is not None
+        and window["price_min"] <= price <= window["price_max"]
+    ]
+    return matching or None
+
+async def refresh_buckets() -> None:
+    """Periodically refetch the listings for every price bucket"""
+    while True:
+        # Guard the whole iteration so one bad refresh can't stop the pool updating
+        try:
+            results = await asyncio.gather(
+                *(fetch_listings(listing_params(bucket)) for bucket in PRICE_BUCKETS),
+                return_exceptions=True
+            )
+            for bucket, result in zip(PRICE_BUCKETS, results):
+                if isinstance(result, Exception):
+                    error = describe_http_error(result) if isinstance(result, httpx.HTTPError) else repr(result)
+                    logger.warning(f"Failed to refresh ${bucket} bucket: {error}")
+                else:
+                    BUCKET_CACHE[bucket] = (time.monotonic(), result)
+            logger.debug("Refreshed %d price buckets", len(BUCKET_CACHE))
+        except Exception:
+            logger.exception("Price bucket refresh failed")
+        await asyncio.sleep(BUCKET_REFRESH_INTERVAL)
+
+def log_car_request(meta: dict, level: int = logging.INFO, exc_info: BaseException | None = None) -> None:
+    """Emit the single per-request log record; fields are also attached for structured formatters"""
+    logger.log(
+        level,
+        "car_request query=%r price=%s records=%s cached=%s outcome=%s selected=%s error=%s",
+        meta["query"], meta["price"], meta["records"], meta["cached"],
+        meta["outcome"], meta["selected"], meta["error"],
+        extra=meta,
+        exc_info=exc_info
+    )
+
+async def get_autodev_car(update: Update, target_price: int, search_query: str = None) -> None:
+    params = listing_params(target_price)
+
     # Add search parameters from natural language query
     if search_query:
-        logger.info(f"Processing search query: {search_query}")
         additional_params = await parse_car_query(search_query)
-        logger.info(f"Additional parameters from query: {additional_params}")
+        logger.debug("Additional parameters from query %r: %s", search_query, additional_params)
         params.update(additional_params)
-        logger.info(f"Final parameters for Auto.dev API: {params}")
+
+    meta = {
+        "query": search_query,
+        "price": target_price,
+        "cached": True,
+        "records": None,
+        "outcome": "ok",
+        "selected": None,
+        "error": None,
+    }
+    level, exc_info = logging.INFO, None
 
     try:
-        logger.info(f"Making request to Auto.dev API: {url}")
-        response = requests.get(url, params=params, timeout=10)
-        
-        # Log the actual URL being called
-        logger.info(f"Full URL with parameters: {response.url}")
-        
-        try:
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            logger.error(f"HTTP error occurred: {e}")
-            logger.error(f"Response content: {response.text}")
-            raise
+        # Plain price lookups can be served from the warm bucket pool
+        pooled = None if search_query else bucket_records(target_price)
+        if pooled is not None:
+            data = {"records": pooled}
+        else:
+            cache_key = "autodev:" + hashlib.sha1(orjson.dumps(params, option=orjson.OPT_SORT_KEYS)).hexdigest()
+            data = await get_cached_listings(cache_key)
+
+            if data is None:
+                meta["cached"] = False
+                data = {"records": await fetch_listings(params)}
+                # Write the cache in the background so the reply doesn't wait on Redis
+                task = asyncio.create_task(set_cached_listings(cache_key, orjson.dumps(data)))
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
+
+        records = data.get('records', [])
+        record_count = len(records)
+        meta["records"] = record_count
 
-        data = response.json()
-        
-        record_count = len(data.get('records', []))
-        logger.info(f"Auto.dev API returned {record_count} records")
-        
         if record_count == 0:
-            if target_price < 1000:
-                with open('./betless.jpeg', 'rb') as photo:
-                    await update.message.reply_photo(photo=photo)
-                return
-            elif target_price > 25000000:
-                with open('./betless.jpeg', 'rb') as photo:
-                    await update.message.reply_photo(photo=photo)
-                return
+            meta["outcome"] = "no_results"
+            if target_price < 1000 or target_price > 25000000:
+                await reply_local_photo(update, './betless.jpeg')
             else:
                 await update.message.reply_text("Sorry, I couldn't find any cars matching your criteria. Try adjusting your search parameters.")
-                return
-        
-        # Log first few records for debugging
-        if record_count > 0:
-            logger.info("First record details:")
-            first_record = data['records'][0]
-            logger.info(f"Year: {first_record.get('year')}")
-            logger.info(f"Make: {first_record.get('make')}")
-            logger.info(f"Model: {first_record.get('model')}")
-            logger.info(f"Price: {first_record.get('price')}")
-
-        listing = random.choice(data['records'])
+            return
+
+        listing = random.choice(records)
         year = listing.get('year', 'N/A')
         make = listing.get('make', 'N/A')
         model = listing.get('model', 'N/A')
         photo_url = listing.get('primaryPhotoUrl')
-        
-        logger.info(f"Selected car: {year} {make} {model}")
+
+        meta["selected"] = f"{year} {make} {model}"
 
         message = f"With your ${target_price}, you could have bought a {year} {make} {model}!"
 
@@ -200,16 +598,25 @@ async def get_autodev_car(update: Update, target_price: int, search_query: str =
         else:
             await update.message.reply_text(message)
 
-    except requests.exceptions.Timeout:
-        logger.error("Request to Auto.dev API timed out")
+    except httpx.TimeoutException as e:
+        meta.update(outcome="timeout", error=describe_http_error(e))
+        level = logging.ERROR
         await update.message.reply_text("The request timed out. Please try again.")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Request error occurred: {e}")
+    except asyncio.TimeoutError as e:
+        meta.update(outcome="timeout", error=repr(e))
+        level = logging.ERROR
+        await update.message.reply_text("The request timed out. Please try again.")
+    except httpx.HTTPError as e:
+        meta.update(outcome="http_error", error=describe_http_error(e))
+        level = logging.ERROR
         await update.message.reply_text("An error occurred while fetching car data. Please try again.")
     except Exception as e:
-        logger.error(f"Error in get_autodev_car: {str(e)}")
-        logger.exception("Full traceback:")
+        meta.update(outcome="error", error=repr(e))
+        level, exc_info = logging.ERROR, e
         await update.message.reply_text("An error occurred. Please try again.")
+    finally:
+        # Logged once, after the reply, whatever the outcome
+        log_car_request(meta, level, exc_info)
 
 async def get_random_car(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
@@ -228,7 +635,7 @@ async def get_random_car(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         search_query = " ".join(args[1:]) if len(args) > 1 else None
         
         # Log the incoming command
-        logger.info(f"Received command: /car {amount} {search_query if search_query else ''}")
+        logger.debug("Received command: /car %s %s", amount, search_query or '')
 
         if search_query == "ebay":
             # ... existing eBay handling ...
@@ -240,31 +647,62 @@ async def get_random_car(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logger.error(f"Error in get_random_car: {e}")
         await update.message.reply_text("An error occurred. Please try again.")
 
+async def post_init(application: Application) -> None:
+    application.bot_data["bucket_refresher"] = asyncio.create_task(refresh_buckets())
+
+async def post_shutdown(application: Application) -> None:
+    refresher = application.bot_data.get("bucket_refresher")
+    if refresher is not None:
+        refresher.cancel()
+    await client.aclose()
+    await aclient.close()
+    if redis_client is not None:
+        await redis_client.aclose()
+
 def main():
     # Initialize the application with more aggressive settings
     logger.info("Initializing bot application...")
     application = (
         Application.builder()
         .token(TOKEN)
-        .connection_pool_size(8)
+        .concurrent_updates(64)
+        .connection_pool_size(64)
         .get_updates_connection_pool_size(8)
         .get_updates_connect_timeout(30.0)
         .get_updates_read_timeout(30.0)
         .get_updates_write_timeout(30.0)
         .get_updates_pool_timeout(30.0)
+        # Stay under Telegram's ~30 msg/s bot-wide limit instead of collecting 429s
+        .rate_limiter(AIORateLimiter(overall_max_rate=28, overall_time_period=1))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .build()
     )
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("car", get_random_car))
+    application.add_handler(CommandHandler("car", get_random_car, block=False))
 
-    # Start the bot
-    logger.info("Starting bot...")
-    application.run_polling(
-        allowed_updates=Update.ALL_TYPES,
-        drop_pending_updates=True
-    )
+    # Start the bot. Use a webhook when a public URL is configured (TLS is
+    # terminated at the reverse proxy), otherwise fall back to polling.
+    if WEBHOOK_URL:
+        logger.info(f"Starting bot with webhook on port {PORT}...")
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=TOKEN,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{TOKEN}",
+            max_connections=40,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=True
+        )
+    else:
+        logger.info("Starting bot with polling...")
+        application.run_polling(
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=True
+        )
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,37 @@
+import os
+import logging
+from functools import lru_cache
+from types import SimpleNamespace
+from dotenv import load_dotenv
+
+logger = logging.getLogger('carbot')
+
+@lru_cache(maxsize=1)
+def settings() -> SimpleNamespace:
+    """Load .env once and return the validated bot configuration"""
+    load_dotenv()
+
+    # token = os.getenv('TEST_TELEGRAM_BOT_TOKEN') # used to test
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    auto_dev_api_key = os.getenv('AUTO_DEV_API_KEY')
+    openai_api_key = os.getenv('OPENAI_API_KEY')
+
+    # Validate environment variables
+    if not token or not auto_dev_api_key:
+        logger.error("Missing required environment variables. Please check your .env file.")
+        raise ValueError("Missing required environment variables. Please check your .env file.")
+
+    if not openai_api_key:
+        logger.error("Missing OpenAI API key in .env file")
+        raise ValueError("Missing OpenAI API key in .env file")
+
+    return SimpleNamespace(
+        token=token,
+        auto_dev_api_key=auto_dev_api_key,
+        openai_api_key=openai_api_key,
+        redis_url=os.getenv('REDIS_URL'),
+        webhook_url=os.getenv('WEBHOOK_URL'),
+        webhook_secret=os.getenv('WEBHOOK_SECRET'),
+        port=int(os.getenv('PORT', '8443')),
+        betless_file_id=os.getenv('BETLESS_FILE_ID'),
+    )